@@ -0,0 +1,27 @@
+"""
+Ahead-of-time build of the audio conversion kernels
+
+Run once at build time, from the backend directory:
+
+    python _audio_kernels_aot.py
+
+This writes the _audio_kernels extension module next to this file.
+audio_kernels imports it when present, so a fresh server process starts
+converting audio without any Numba compile step. Without it, audio_kernels
+falls back to JIT-compiling the same kernels.
+"""
+import os
+
+from numba.pycc import CC
+
+from audio_kernels import KERNELS
+
+cc = CC("_audio_kernels")
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+for name, (func, signature) in KERNELS.items():
+    cc.export(name, signature)(func)
+
+
+if __name__ == "__main__":
+    cc.compile()
@@ -1,167 +1,215 @@
-import base64
+import binascii
 import struct
 import logging
 import numpy as np
+from typing import Optional, Union
+from scipy.signal import firwin
+from audio_kernels import (
+    mulaw_decode,
+    mulaw_encode,
+    resample_linear,
+    mulaw8k_to_pcm16k,
+    pcm24k_to_mulaw8k,
+)
 
 logger = logging.getLogger(__name__)
 
+try:
+    import pybase64
+except ImportError:  # optional SIMD base64 codec; binascii is the fallback
+    pybase64 = None
+
+
+if pybase64 is not None:
+    def b64decode(data: Union[str, bytes]) -> bytes:
+        """Decode a base64 payload (str or bytes)"""
+        return pybase64.b64decode(data)
+
+    def b64encode(data) -> str:
+        """Base64-encode a bytes-like object (e.g. a numpy array) to str"""
+        return pybase64.b64encode_as_string(data)
+
+    def b64encode_bytes(data) -> bytes:
+        """Base64-encode a bytes-like object to ASCII bytes"""
+        return pybase64.b64encode(data)
+else:
+    def b64decode(data: Union[str, bytes]) -> bytes:
+        """Decode a base64 payload (str or bytes)"""
+        return binascii.a2b_base64(data)
+
+    def b64encode(data) -> str:
+        """Base64-encode a bytes-like object (e.g. a numpy array) to str"""
+        return binascii.b2a_base64(data, newline=False).decode('ascii')
+
+    def b64encode_bytes(data) -> bytes:
+        """Base64-encode a bytes-like object to ASCII bytes"""
+        return binascii.b2a_base64(data, newline=False)
+
+
+# Polyphase FIR length; odd so the filter has an integer group delay
+RESAMPLE_TAPS = 63
+
+
+def _design_polyphase_filter(up: int, down: int):
+    """Design a windowed-sinc low-pass FIR for a fixed up/down ratio
+
+    Returns the zero-padded filter and the number of leading output samples
+    to skip so that output samples line up with the input (as resample_poly).
+    """
+    half_len = (RESAMPLE_TAPS - 1) // 2
+    h = firwin(RESAMPLE_TAPS, 1.0 / max(up, down), window=("kaiser", 5.0)) * up
+    pre_pad = down - half_len % down
+    pre_remove = (half_len + pre_pad) // down
+    h = np.concatenate((np.zeros(pre_pad), h)).astype(np.float32)
+    return h, pre_remove
+
+
+_H_UP2, _UP2_DELAY = _design_polyphase_filter(2, 1)        # 8kHz -> 16kHz
+_H_DOWN3, _DOWN3_DELAY = _design_polyphase_filter(1, 3)    # 24kHz -> 8kHz
+
+# Streaming Gemini -> Twilio conversion works on whole 20 ms Twilio frames
+TWILIO_FRAME_SAMPLES = 160                              # 20 ms at 8kHz
+GEMINI_FRAME_BYTES = 3 * TWILIO_FRAME_SAMPLES * 2       # 20 ms of 24kHz PCM16
+# Input history carried between frames: covers the FIR and is a multiple of 3
+DOWNSAMPLE_HISTORY = -(-(_H_DOWN3.size - 1) // 3) * 3
+
+
+def _scratch(out: Optional[np.ndarray], size: int, dtype) -> np.ndarray:
+    """Return the first size elements of out, or a new array if out is too small"""
+    if out is not None and out.size >= size:
+        return out[:size]
+    return np.empty(size, dtype=dtype)
+
+
 class AudioConverter:
     """Handles audio format conversion between Twilio and Gemini formats"""
     
     @staticmethod
-    def mulaw_to_pcm16(mulaw_data: bytes) -> bytes:
-        """Convert μ-law audio to 16-bit PCM using a simple lookup approach"""
-        try:
-            if not mulaw_data:
-                return b''
-            
-            # Convert μ-law bytes to numpy array
-            mulaw_array = np.frombuffer(mulaw_data, dtype=np.uint8)
-            
-            # Simplified μ-law to linear conversion
-            # Remove bias and get magnitude
-            biased = mulaw_array ^ 0x55  # Remove bias
-            sign = (biased & 0x80) != 0
-            exponent = (biased & 0x70) >> 4
-            mantissa = biased & 0x0F
-            
-            # Convert to linear scale
-            linear = (mantissa * 2 + 33) << np.maximum(0, exponent - 1)
-            linear = np.where(sign, -linear, linear)
-            
-            # Scale to 16-bit PCM range and convert to int16
-            pcm16 = np.clip(linear * 4, -32768, 32767).astype(np.int16)
-            
-            return pcm16.tobytes()
-            
-        except Exception as e:
-            logger.error(f"Error converting μ-law to PCM: {e}")
-            # Return silence as fallback
-            return b'\x00' * (len(mulaw_data) * 2)
+    def mulaw_to_pcm16(mulaw_data: bytes, out: Optional[np.ndarray] = None) -> bytes:
+        """
+        Convert μ-law audio to 16-bit PCM using the G.711 lookup table
+        
+        If out (int16) is large enough, samples are decoded into it instead of
+        a newly allocated array.
+        """
+        if not mulaw_data:
+            return b''
+        
+        mulaw_array = np.frombuffer(mulaw_data, dtype=np.uint8)
+        pcm16 = _scratch(out, mulaw_array.size, np.int16)
+        mulaw_decode(mulaw_array, pcm16)
+        
+        return pcm16.tobytes()
     
     @staticmethod
-    def pcm16_to_mulaw(pcm_data: bytes) -> bytes:
-        """Convert 16-bit PCM to μ-law audio"""
-        try:
-            if not pcm_data:
-                return b''
-            
-            # Convert PCM bytes to numpy array
-            pcm_array = np.frombuffer(pcm_data, dtype=np.int16)
-            
-            # Simple linear to μ-law conversion
-            sign = pcm_array < 0
-            abs_pcm = np.abs(pcm_array.astype(np.int32))
-            
-            # Compress to μ-law range (simplified)
-            compressed = np.clip(abs_pcm // 256, 0, 127)
-            
-            # Add sign bit and bias
-            mulaw = compressed.astype(np.uint8)
-            mulaw = np.where(sign, mulaw | 0x80, mulaw)
-            mulaw = mulaw ^ 0x55  # Add bias
-            
-            return mulaw.tobytes()
-            
-        except Exception as e:
-            logger.error(f"Error converting PCM to μ-law: {e}")
-            # Return silence as fallback
-            return b'\x55' * (len(pcm_data) // 2)
+    def pcm16_to_mulaw(pcm_data: bytes, out: Optional[np.ndarray] = None) -> bytes:
+        """
+        Convert 16-bit PCM to μ-law audio using the G.711 lookup table
+        
+        If out (uint8) is large enough, samples are encoded into it instead of
+        a newly allocated array.
+        """
+        if not pcm_data:
+            return b''
+        assert len(pcm_data) % 2 == 0, "16-bit PCM must have an even byte length"
+        
+        pcm_array = np.frombuffer(pcm_data, dtype=np.int16)
+        mulaw = _scratch(out, pcm_array.size, np.uint8)
+        mulaw_encode(pcm_array, mulaw)
+        
+        return mulaw.tobytes()
     
     @staticmethod
     def resample_audio(audio_data: bytes, from_rate: int, to_rate: int, sample_width: int = 2) -> bytes:
-        """Resample audio from one rate to another using numpy"""
-        try:
-            if not audio_data or from_rate == to_rate:
-                return audio_data
-            
-            # Convert to numpy array
-            if sample_width == 2:
-                audio_array = np.frombuffer(audio_data, dtype=np.int16)
-            else:
-                audio_array = np.frombuffer(audio_data, dtype=np.uint8)
-            
-            if len(audio_array) == 0:
-                return audio_data
-            
-            # Calculate resampling ratio
-            ratio = to_rate / from_rate
-            
-            # Simple linear interpolation resampling
-            original_length = len(audio_array)
-            new_length = max(1, int(original_length * ratio))
-            
-            # Create new indices
-            new_indices = np.linspace(0, original_length - 1, new_length)
-            
-            # Interpolate
-            resampled = np.interp(new_indices, np.arange(original_length), audio_array.astype(np.float32))
-            
-            # Convert back to original dtype
-            if sample_width == 2:
-                resampled = np.clip(resampled, -32768, 32767).astype(np.int16)
-            else:
-                resampled = np.clip(resampled, 0, 255).astype(np.uint8)
-            
-            return resampled.tobytes()
-            
-        except Exception as e:
-            logger.error(f"Error resampling audio from {from_rate}Hz to {to_rate}Hz: {e}")
+        """Resample audio from one rate to another using linear interpolation"""
+        if not audio_data or from_rate == to_rate:
             return audio_data
+        assert sample_width in (1, 2), "only 8-bit and 16-bit samples are supported"
+        assert len(audio_data) % sample_width == 0, "audio must hold whole samples"
+        
+        # Convert to numpy array
+        if sample_width == 2:
+            audio_array = np.frombuffer(audio_data, dtype=np.int16)
+        else:
+            audio_array = np.frombuffer(audio_data, dtype=np.uint8)
+        
+        # Calculate resampling ratio
+        ratio = to_rate / from_rate
+        original_length = len(audio_array)
+        new_length = max(1, int(original_length * ratio))
+        
+        if sample_width == 2:
+            resampled = np.empty(new_length, dtype=np.int16)
+            resample_linear(audio_array, resampled)
+            return resampled.tobytes()
+        
+        # 8-bit samples are rare enough to stay on the generic numpy path
+        new_indices = np.linspace(0, original_length - 1, new_length)
+        resampled = np.interp(new_indices, np.arange(original_length), audio_array.astype(np.float32))
+        
+        return np.clip(resampled, 0, 255).astype(np.uint8).tobytes()
     
     @staticmethod
-    def twilio_to_gemini_format(base64_mulaw: str) -> str:
+    def twilio_to_gemini_format(base64_mulaw: Union[str, bytes], out: Optional[np.ndarray] = None) -> str:
         """
         Convert Twilio μ-law audio to Gemini PCM format
         
         Twilio: μ-law, 8kHz, base64 encoded
         Gemini: PCM, 16kHz, base64 encoded
+        
+        Accepts the base64 payload as str or as bytes sliced from a raw frame.
+        An int16 scratch array can be passed as out to hold the 16kHz PCM.
+        """
+        return AudioConverter.twilio_to_gemini_payload(base64_mulaw, out).decode('ascii')
+    
+    @staticmethod
+    def twilio_to_gemini_payload(base64_mulaw: Union[str, bytes], out: Optional[np.ndarray] = None) -> bytes:
+        """
+        twilio_to_gemini_format returning the base64 PCM as ASCII bytes
+        
+        The bytes can be spliced straight into a pre-serialized message.
         """
         try:
             if not base64_mulaw:
-                return ""
+                return b""
             
             # Decode base64 μ-law data
-            mulaw_data = base64.b64decode(base64_mulaw)
+            mulaw_data = np.frombuffer(b64decode(base64_mulaw), dtype=np.uint8)
             
-            # Convert μ-law to PCM (16-bit)
-            pcm_8khz = AudioConverter.mulaw_to_pcm16(mulaw_data)
-            
-            # Resample from 8kHz to 16kHz
-            pcm_16khz = AudioConverter.resample_audio(pcm_8khz, 8000, 16000)
+            # Decode μ-law and resample from 8kHz to 16kHz in one pass
+            pcm_16khz = _scratch(out, 2 * mulaw_data.size, np.int16)
+            mulaw8k_to_pcm16k(mulaw_data, pcm_16khz, _H_UP2, _UP2_DELAY)
             
             # Encode back to base64
-            base64_pcm = base64.b64encode(pcm_16khz).decode('utf-8')
-            
-            return base64_pcm
+            return b64encode_bytes(pcm_16khz)
             
         except Exception as e:
             logger.error(f"Error converting Twilio to Gemini format: {e}")
-            return ""
+            return b""
     
     @staticmethod
-    def gemini_to_twilio_format(base64_pcm: str) -> str:
+    def gemini_to_twilio_format(base64_pcm: Union[str, bytes]) -> str:
         """
         Convert Gemini PCM audio to Twilio μ-law format
         
         Gemini: PCM, 24kHz, base64 encoded  
         Twilio: μ-law, 8kHz, base64 encoded
+        
+        Accepts the base64 payload as str or as bytes sliced from a raw frame.
         """
         try:
             if not base64_pcm:
                 return ""
             
             # Decode base64 PCM data
-            pcm_data = base64.b64decode(base64_pcm)
-            
-            # Resample from 24kHz to 8kHz
-            pcm_8khz = AudioConverter.resample_audio(pcm_data, 24000, 8000)
+            pcm_data = np.frombuffer(b64decode(base64_pcm), dtype=np.int16)
             
-            # Convert PCM to μ-law
-            mulaw_data = AudioConverter.pcm16_to_mulaw(pcm_8khz)
+            # Resample from 24kHz to 8kHz and encode to μ-law in one pass
+            mulaw_data = np.empty(-(-pcm_data.size // 3), dtype=np.uint8)
+            pcm24k_to_mulaw8k(pcm_data, mulaw_data, _H_DOWN3, _DOWN3_DELAY)
             
             # Encode back to base64
-            base64_mulaw = base64.b64encode(mulaw_data).decode('utf-8')
+            base64_mulaw = b64encode(mulaw_data)
             
             return base64_mulaw
             
@@ -169,6 +217,62 @@ class AudioConverter:
             logger.error(f"Error converting Gemini to Twilio format: {e}")
             return ""
 
+    @staticmethod
+    def roundtrip(base64_mulaw: Union[str, bytes]) -> str:
+        """
+        Same result as gemini_to_twilio_format(twilio_to_gemini_format(...))
+        
+        The intermediate PCM is handed straight from one kernel to the other
+        instead of being base64-encoded and decoded again in between. Used by
+        the performance suite to time a full conversion round trip.
+        """
+        try:
+            if not base64_mulaw:
+                return ""
+            
+            mulaw_data = np.frombuffer(b64decode(base64_mulaw), dtype=np.uint8)
+            pcm_data = np.empty(2 * mulaw_data.size, dtype=np.int16)
+            mulaw8k_to_pcm16k(mulaw_data, pcm_data, _H_UP2, _UP2_DELAY)
+            
+            mulaw_back = np.empty(-(-pcm_data.size // 3), dtype=np.uint8)
+            pcm24k_to_mulaw8k(pcm_data, mulaw_back, _H_DOWN3, _DOWN3_DELAY)
+            
+            return b64encode(mulaw_back)
+            
+        except Exception as e:
+            logger.error(f"Error converting audio round trip: {e}")
+            return ""
+
+    @staticmethod
+    def new_downsample_state() -> np.ndarray:
+        """
+        Create the buffer used by gemini_frame_to_twilio_format
+        
+        It holds the FIR input history followed by room for one 20 ms frame,
+        so frames are copied in place instead of into a new array.
+        """
+        return np.zeros(DOWNSAMPLE_HISTORY + GEMINI_FRAME_BYTES // 2, dtype=np.int16)
+    
+    @staticmethod
+    def gemini_frame_to_twilio_format(pcm_frame: bytes, state: np.ndarray,
+                                      out: Optional[np.ndarray] = None) -> str:
+        """
+        Convert one 20 ms frame of a continuous Gemini PCM stream to Twilio μ-law
+        
+        Unlike gemini_to_twilio_format, the FIR input history is carried over
+        in state (updated in place) so consecutive frames are filtered as one
+        signal, without zero-padding transients at frame boundaries. An uint8
+        scratch array can be passed as out to hold the μ-law samples.
+        """
+        assert len(pcm_frame) == GEMINI_FRAME_BYTES, "expected one 20 ms frame"
+        
+        state[DOWNSAMPLE_HISTORY:] = np.frombuffer(pcm_frame, dtype=np.int16)
+        mulaw_data = _scratch(out, TWILIO_FRAME_SAMPLES, np.uint8)
+        pcm24k_to_mulaw8k(state, mulaw_data, _H_DOWN3, DOWNSAMPLE_HISTORY // 3)
+        state[:DOWNSAMPLE_HISTORY] = state[-DOWNSAMPLE_HISTORY:]
+        
+        return b64encode(mulaw_data)
+    
     @staticmethod
     def create_gemini_audio_message(base64_pcm: str) -> dict:
         """Create Gemini-compatible realtime_input message"""
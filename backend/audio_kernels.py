@@ -0,0 +1,148 @@
+"""
+Compiled audio kernels shared by AudioConverter
+
+Each kernel works on caller-provided numpy buffers (G.711 μ-law tables and
+fused μ-law/resampling loops), so a converter can run a whole frame without
+intermediate allocations.
+"""
+import numpy as np
+from numba import njit, types
+
+# G.711 μ-law constants
+MULAW_BIAS = 0x84
+MULAW_CLIP = 32635
+
+
+def _build_mulaw_to_pcm_table() -> np.ndarray:
+    """Build the 256-entry μ-law → 16-bit PCM decode table (ITU-T G.711)"""
+    mulaw = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = mulaw & 0x80
+    exponent = (mulaw >> 4) & 0x07
+    mantissa = mulaw & 0x0F
+    magnitude = (((mantissa << 3) + MULAW_BIAS) << exponent) - MULAW_BIAS
+    return np.where(sign != 0, -magnitude, magnitude).astype(np.int16)
+
+
+def _build_pcm_to_mulaw_table() -> np.ndarray:
+    """Build the 65536-entry 16-bit PCM → μ-law encode table (ITU-T G.711)
+
+    The table is indexed by the unsigned bit pattern of the int16 sample.
+    """
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)
+    sign = np.where(pcm < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(pcm), MULAW_CLIP) + MULAW_BIAS
+    # Exponent is the position of the highest set bit of (magnitude >> 7)
+    segment = magnitude >> 7
+    exponent = np.zeros_like(segment)
+    for bit in range(1, 8):
+        exponent[segment >= (1 << bit)] = bit
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+_MULAW_TO_PCM = _build_mulaw_to_pcm_table()
+_PCM_TO_MULAW = _build_pcm_to_mulaw_table()
+
+# np.frombuffer() over bytes yields read-only arrays
+_U8_IN = types.Array(types.uint8, 1, "C", readonly=True)
+_I16_IN = types.Array(types.int16, 1, "C", readonly=True)
+
+
+def _mulaw_decode(src, dst):
+    for i in range(src.size):
+        dst[i] = _MULAW_TO_PCM[src[i]]
+
+
+def _mulaw_encode(src, dst):
+    for i in range(src.size):
+        dst[i] = _PCM_TO_MULAW[src[i] & 0xFFFF]
+
+
+def _resample_linear(src, dst):
+    """Linearly interpolate src onto len(dst) evenly spaced points"""
+    n = src.size
+    m = dst.size
+    if m == 1 or n == 1:
+        dst[:] = src[0]
+        return
+    step = (n - 1) / (m - 1)
+    for j in range(m):
+        pos = j * step
+        i = min(int(pos), n - 2)
+        frac = pos - i
+        value = src[i] + (src[i + 1] - src[i]) * frac
+        dst[j] = max(-32768.0, min(32767.0, value))
+
+
+def _mulaw8k_to_pcm16k(src, dst, h, delay):
+    """Fused μ-law decode + 2x polyphase upsample (Twilio -> Gemini)
+
+    Each 16kHz output sample only touches the input taps of its polyphase
+    branch, decoding μ-law on the fly, so no intermediate buffers exist.
+    """
+    n = src.size
+    for j in range(dst.size):
+        m = j + delay
+        acc = np.float32(0.0)
+        for k in range(m & 1, h.size, 2):
+            i = (m - k) >> 1
+            if i < 0:
+                break
+            if i < n:
+                acc += h[k] * _MULAW_TO_PCM[src[i]]
+        dst[j] = max(-32768.0, min(32767.0, acc))
+
+
+def _pcm24k_to_mulaw8k(src, dst, h, delay):
+    """Fused 3x polyphase downsample + μ-law encode (Gemini -> Twilio)"""
+    n = src.size
+    for j in range(dst.size):
+        m = (j + delay) * 3
+        acc = np.float32(0.0)
+        for k in range(max(0, m - n + 1), min(h.size, m + 1)):
+            acc += h[k] * src[m - k]
+        sample = np.int16(max(-32768.0, min(32767.0, acc)))
+        dst[j] = _PCM_TO_MULAW[sample & 0xFFFF]
+
+
+# Kernel name -> (Python implementation, signature). Used to compile the
+# kernels here, or ahead of time by _audio_kernels_aot.py.
+KERNELS = {
+    "mulaw_decode": (_mulaw_decode, types.void(_U8_IN, types.int16[::1])),
+    "mulaw_encode": (_mulaw_encode, types.void(_I16_IN, types.uint8[::1])),
+    "resample_linear": (_resample_linear, types.void(_I16_IN, types.int16[::1])),
+    "mulaw8k_to_pcm16k": (
+        _mulaw8k_to_pcm16k,
+        types.void(_U8_IN, types.int16[::1], types.float32[::1], types.int64),
+    ),
+    "pcm24k_to_mulaw8k": (
+        _pcm24k_to_mulaw8k,
+        types.void(_I16_IN, types.uint8[::1], types.float32[::1], types.int64),
+    ),
+}
+
+
+def _load_kernels() -> dict:
+    """Load the compiled kernels
+
+    Prefers the ahead-of-time built _audio_kernels extension, which imports
+    without any compile step. Otherwise the kernels are JIT-compiled eagerly
+    here (explicit signatures) and cached on disk, so the first audio frame
+    of a call never pays the JIT cost.
+    """
+    try:
+        import _audio_kernels
+    except ImportError:
+        return {
+            name: njit(signature, cache=True, fastmath=True)(func)
+            for name, (func, signature) in KERNELS.items()
+        }
+    return {name: getattr(_audio_kernels, name) for name in KERNELS}
+
+
+_kernels = _load_kernels()
+mulaw_decode = _kernels["mulaw_decode"]
+mulaw_encode = _kernels["mulaw_encode"]
+resample_linear = _kernels["resample_linear"]
+mulaw8k_to_pcm16k = _kernels["mulaw8k_to_pcm16k"]
+pcm24k_to_mulaw8k = _kernels["pcm24k_to_mulaw8k"]
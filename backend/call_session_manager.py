@@ -1,15 +1,39 @@
 import asyncio
 import json
 import logging
+import numpy as np
 import websockets
-from typing import Dict, Optional
+from typing import Dict, Optional, Union
 from virtual_client import VirtualWebSocketClient
+from audio_converter import AudioConverter, GEMINI_FRAME_BYTES, TWILIO_FRAME_SAMPLES, b64decode
 
 logger = logging.getLogger(__name__)
 
+# Twilio frames (20 ms each) buffered per call while Gemini is slow to accept
+# them; beyond this the oldest audio is dropped. The virtual client's bounded
+# out_queue blocks the sender task when the socket stalls, so together with
+# it at most about 0.75 s of audio is held back per call.
+GEMINI_QUEUE_SIZE = 32
+
 class CallSession:
     """Represents an active phone call session"""
     
+    __slots__ = (
+        "call_sid",
+        "stream_sid",
+        "twilio_websocket",
+        "virtual_client",
+        "connected",
+        "_twilio_msg_prefix",
+        "_twilio_msg_suffix",
+        "_pcm24_buf",
+        "_resample_state",
+        "_mulaw_scratch",
+        "gemini_queue",
+        "_gemini_sender",
+        "__weakref__",
+    )
+    
     def __init__(self, call_sid: str, stream_sid: str, twilio_websocket):
         self.call_sid = call_sid
         self.stream_sid = stream_sid
@@ -17,6 +41,24 @@ class CallSession:
         self.virtual_client: Optional[VirtualWebSocketClient] = None
         self.connected = False
         
+        # Outbound media messages only differ in their payload, so the JSON
+        # around it is rendered once per session. Base64 needs no escaping.
+        self._twilio_msg_prefix = (
+            '{"event":"media","streamSid":' + json.dumps(stream_sid) + ',"media":{"payload":"'
+        )
+        self._twilio_msg_suffix = '"}}'
+        
+        # Gemini audio is buffered until whole 20 ms Twilio frames are
+        # available; the resampler history carries over between frames
+        self._pcm24_buf = bytearray()
+        self._resample_state = AudioConverter.new_downsample_state()
+        self._mulaw_scratch = np.empty(TWILIO_FRAME_SAMPLES, dtype=np.uint8)
+        
+        # Twilio audio waits here for the sender task, so reading the Twilio
+        # socket never blocks on the Gemini leg
+        self.gemini_queue: asyncio.Queue = asyncio.Queue(maxsize=GEMINI_QUEUE_SIZE)
+        self._gemini_sender: Optional[asyncio.Task] = None
+        
         logger.info(f"Created call session - CallSid: {call_sid}, StreamSid: {stream_sid}")
     
     async def start_gemini_connection(self):
@@ -27,11 +69,13 @@ class CallSession:
             # Set up callbacks
             self.virtual_client.on_audio_response = self.send_audio_to_twilio
             self.virtual_client.on_text_response = self.handle_text_response
+            self.virtual_client.on_turn_end = self.end_gemini_turn
             self.virtual_client.on_error = self.handle_error
             
             # Connect to Gemini
             await self.virtual_client.connect()
             self.connected = True
+            self._gemini_sender = asyncio.create_task(self._send_queued_audio())
             
             logger.info(f"Gemini connection established for call {self.call_sid}")
             
@@ -39,33 +83,70 @@ class CallSession:
             logger.error(f"Failed to start Gemini connection: {e}")
             self.connected = False
     
-    async def send_audio_to_gemini(self, base64_mulaw: str):
+    def queue_audio_for_gemini(self, base64_mulaw: Union[str, bytes]):
+        """Queue audio from Twilio for Gemini, dropping the oldest frame when full"""
+        queue = self.gemini_queue
+        if queue.full():
+            queue.get_nowait()
+            logger.debug("Dropped audio frame for call %s", self.call_sid)
+        queue.put_nowait(base64_mulaw)
+    
+    async def _send_queued_audio(self):
+        """Forward queued Twilio audio to Gemini for the rest of the call"""
+        queue = self.gemini_queue
+        while True:
+            await self.send_audio_to_gemini(await queue.get())
+    
+    async def send_audio_to_gemini(self, base64_mulaw: Union[str, bytes]):
         """Send audio from Twilio to Gemini"""
         if self.virtual_client and self.connected:
             await self.virtual_client.send_audio_from_twilio(base64_mulaw)
     
-    async def send_audio_to_twilio(self, base64_mulaw: str):
-        """Send audio response from Gemini back to Twilio"""
+    async def send_audio_to_twilio(self, base64_pcm: str):
+        """Convert Gemini audio (24kHz PCM, base64) and send it to Twilio in 20 ms frames"""
         try:
             if self.twilio_websocket:
-                # Create Twilio media message
-                media_message = {
-                    "event": "media",
-                    "streamSid": self.stream_sid,
-                    "media": {
-                        "payload": base64_mulaw
-                    }
-                }
+                self._pcm24_buf += b64decode(base64_pcm)
+                
+                while len(self._pcm24_buf) >= GEMINI_FRAME_BYTES:
+                    frame = bytes(self._pcm24_buf[:GEMINI_FRAME_BYTES])
+                    del self._pcm24_buf[:GEMINI_FRAME_BYTES]
+                    
+                    await self._send_twilio_frame(frame)
                 
-                await self.twilio_websocket.send(json.dumps(media_message))
-                logger.debug(f"Sent audio to Twilio for call {self.call_sid}")
+                logger.debug("Sent audio to Twilio for call %s", self.call_sid)
                 
         except Exception as e:
             logger.error(f"Error sending audio to Twilio: {e}")
     
+    async def end_gemini_turn(self, interrupted: bool):
+        """Flush the partial frame left at the end of a Gemini turn and reset the resampler"""
+        try:
+            # An interrupted turn is dropped; a finished one keeps its tail,
+            # zero-padded to a whole frame
+            if self._pcm24_buf and not interrupted and self.twilio_websocket:
+                self._pcm24_buf += bytes(GEMINI_FRAME_BYTES - len(self._pcm24_buf))
+                await self._send_twilio_frame(bytes(self._pcm24_buf))
+        except Exception as e:
+            logger.error(f"Error sending audio to Twilio: {e}")
+        finally:
+            self._pcm24_buf.clear()
+            self._resample_state.fill(0)
+    
+    async def _send_twilio_frame(self, frame: bytes):
+        """Convert one 20 ms Gemini frame and send it to Twilio"""
+        base64_mulaw = AudioConverter.gemini_frame_to_twilio_format(
+            frame, self._resample_state, self._mulaw_scratch
+        )
+        
+        # Twilio expects media messages as text frames
+        await self.twilio_websocket.send(
+            self._twilio_msg_prefix + base64_mulaw + self._twilio_msg_suffix
+        )
+    
     def handle_text_response(self, text: str):
         """Handle text responses from Gemini (for logging/debugging)"""
-        logger.info(f"Gemini text response for call {self.call_sid}: {text}")
+        logger.info("Gemini text response for call %s: %s", self.call_sid, text)
     
     def handle_error(self, error: str):
         """Handle errors from virtual client"""
@@ -74,6 +155,10 @@ class CallSession:
     
     async def cleanup(self):
         """Clean up the call session"""
+        if self._gemini_sender:
+            self._gemini_sender.cancel()
+            self._gemini_sender = None
+        
         if self.virtual_client:
             await self.virtual_client.disconnect()
         
@@ -1,15 +1,22 @@
 import asyncio
-import json
 import os
 import ssl
+from datetime import datetime, timedelta, timezone
 
+import orjson
 import websockets
 from websockets.legacy.protocol import WebSocketCommonProtocol
 from websockets.legacy.server import WebSocketServerProtocol
+from websockets.protocol import State
 from dotenv import load_dotenv
 from google.oauth2 import service_account
 from google.auth.transport.requests import Request
 
+try:
+    import uvloop  # libuv-based event loop; not available on Windows
+except ImportError:
+    uvloop = None
+
 load_dotenv()
 
 HOST = "us-central1-aiplatform.googleapis.com"
@@ -21,86 +28,207 @@ PORT = int(os.getenv("PORT", "8080"))
 BIND_HOST = os.getenv("BIND_HOST", "0.0.0.0")
 SSL_CERT = os.getenv("SSL_CERT", None)
 SSL_KEY = os.getenv("SSL_KEY", None)
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "2"))
+
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true")
+# Set LOG_TRANSCRIPTS=0 to forward frames without looking for transcriptions
+LOG_TRANSCRIPTS = os.getenv("LOG_TRANSCRIPTS", "true").lower() in ("1", "true")
+
+
+# Refresh the cached service account token this long before it expires
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+TOKEN_REFRESH_INTERVAL = 30 * 60  # seconds
+
+_credentials = None
+_credentials_lock = asyncio.Lock()
+
+
+def _token_expiring(credentials) -> bool:
+    """Check whether credentials are invalid or about to expire."""
+    if not credentials.valid:
+        return True
+    if credentials.expiry is None:
+        return False
+    # google-auth stores expiry as a naive UTC datetime
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return credentials.expiry - now < TOKEN_REFRESH_MARGIN
 
-DEBUG = True
 
+async def get_access_token_async(force_refresh: bool = False):
+    """
+    Get access token from service account or use provided token.
 
-def get_access_token():
-    """Get access token from service account or use provided token."""
+    The service account credentials are loaded once and their token cached;
+    it is only refreshed (in a worker thread, so the event loop keeps serving
+    other calls) when it is close to expiry.
+    """
+    global _credentials
+    
     if SERVICE_ACCOUNT_KEY and os.path.exists(SERVICE_ACCOUNT_KEY):
-        print(f"Using service account key: {SERVICE_ACCOUNT_KEY}")
-        credentials = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_KEY,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"]
-        )
-        credentials.refresh(Request())
-        return credentials.token
+        async with _credentials_lock:
+            if _credentials is None:
+                print(f"Using service account key: {SERVICE_ACCOUNT_KEY}")
+                _credentials = service_account.Credentials.from_service_account_file(
+                    SERVICE_ACCOUNT_KEY,
+                    scopes=["https://www.googleapis.com/auth/cloud-platform"]
+                )
+            if force_refresh or _token_expiring(_credentials):
+                await asyncio.to_thread(_credentials.refresh, Request())
+            return _credentials.token
     elif BEARER_TOKEN:
-        print("Using provided bearer token")
         return BEARER_TOKEN
     else:
         raise ValueError("No authentication method provided. Set SERVICE_ACCOUNT_KEY or GOOGLE_CLOUD_TOKEN")
 
 
+async def refresh_token_periodically() -> None:
+    """Keep the cached token fresh so no client connection waits on a refresh."""
+    while True:
+        await asyncio.sleep(TOKEN_REFRESH_INTERVAL)
+        try:
+            await get_access_token_async(force_refresh=True)
+        except Exception as e:
+            print(f"Error refreshing access token: {e}")
+
+
+def needs_inspection(message) -> bool:
+    """Return True if a frame has to be parsed for logging before forwarding."""
+    if DEBUG:
+        return True
+    if not LOG_TRANSCRIPTS:
+        return False
+    if isinstance(message, str):
+        return '"inputTranscription"' in message or '"outputTranscription"' in message
+    return b'"inputTranscription"' in message or b'"outputTranscription"' in message
+
+
+def log_message(message) -> None:
+    """Log transcriptions (and non-audio messages when DEBUG is set)."""
+    data = orjson.loads(message)
+    
+    # Log transcription messages with detailed structure
+    if LOG_TRANSCRIPTS and "serverContent" in data:
+        server_content = data["serverContent"]
+        if "inputTranscription" in server_content:
+            transcription = server_content["inputTranscription"]
+            if transcription.get("text"):
+                print(f"🎤 INPUT TRANSCRIPTION: {transcription['text']}")
+        if "outputTranscription" in server_content:
+            transcription = server_content["outputTranscription"]
+            if transcription.get("text"):
+                print(f"🔊 OUTPUT TRANSCRIPTION: {transcription['text']}")
+    
+    # Log setup and non-audio messages for debugging
+    if DEBUG and "realtimeInput" not in data:
+        if "setup" in data:
+            print("Setup message:", data)
+        elif "serverContent" in data and not data["serverContent"].get("modelTurn", {}).get("parts", [{}])[0].get("inlineData"):
+            print("Server message:", data)
+
+
 async def proxy_task(
     client_websocket: WebSocketCommonProtocol, server_websocket: WebSocketCommonProtocol
 ) -> None:
     """
     Forwards messages from one WebSocket connection to another.
 
+    Frames are forwarded verbatim (always as text frames, which is what the
+    browser and virtual clients expect); they are only parsed when they need
+    to be logged.
+
     Args:
         client_websocket: The WebSocket connection from which to receive messages.
         server_websocket: The WebSocket connection to which to send messages.
     """
     async for message in client_websocket:
         try:
-            data = json.loads(message)
-            
-            # Log transcription messages with detailed structure
-            if "serverContent" in data:
-                server_content = data["serverContent"]
-                if "inputTranscription" in server_content:
-                    transcription = server_content["inputTranscription"]
-                    if transcription.get("text"):
-                        print(f"🎤 INPUT TRANSCRIPTION: {transcription['text']}")
-                if "outputTranscription" in server_content:
-                    transcription = server_content["outputTranscription"]
-                    if transcription.get("text"):
-                        print(f"🔊 OUTPUT TRANSCRIPTION: {transcription['text']}")
+            await server_websocket.send(message, text=True)
             
-            # Log setup and non-audio messages for debugging
-            if DEBUG and "realtimeInput" not in data:
-                if "setup" in data:
-                    print("Setup message:", data)
-                elif "serverContent" in data and not data["serverContent"].get("modelTurn", {}).get("parts", [{}])[0].get("inlineData"):
-                    print("Server message:", data)
-                
-            await server_websocket.send(json.dumps(data))
+            if needs_inspection(message):
+                log_message(message)
         except Exception as e:
             print(f"Error processing message: {e}")
 
     await server_websocket.close()
 
 
+async def connect_upstream():
+    """Open an authenticated WebSocket connection to the Gemini API."""
+    token = await get_access_token_async()
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {token}",
+    }
+
+    # Every WebSocket leg in the backend carries base64 audio, which does not
+    # compress, so all of them are opened with permessage-deflate disabled
+    return await websockets.connect(
+        SERVICE_URL,
+        additional_headers=headers,
+        compression=None,
+        max_size=2**20,
+        write_limit=2**20,
+    )
+
+
+class UpstreamPool:
+    """
+    Keeps a few upstream connections open ahead of time so that answering a
+    call does not wait on the TCP + TLS + WebSocket handshakes.
+
+    A Gemini session is bound to the setup message sent on its connection,
+    so connections are handed out once and never returned; each handout
+    triggers a background task that opens a replacement.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._pending = set()
+
+    def start(self) -> None:
+        """Pre-open the configured number of connections."""
+        for _ in range(self.size):
+            self._replenish()
+
+    def _replenish(self) -> None:
+        task = asyncio.create_task(self._open_one())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _open_one(self) -> None:
+        try:
+            self._ready.put_nowait(await connect_upstream())
+        except Exception as e:
+            print(f"Error pre-opening upstream connection: {e}")
+
+    async def acquire(self):
+        """Return a warm connection if one is still open, else open a new one."""
+        while not self._ready.empty():
+            server_websocket = self._ready.get_nowait()
+            self._replenish()
+            if server_websocket.state is State.OPEN:
+                return server_websocket
+        # Pool is empty: pre-opens failed or ran behind, so refill the
+        # missing slots in the background while this caller connects directly
+        for _ in range(self.size - len(self._pending)):
+            self._replenish()
+        return await connect_upstream()
+
+
+upstream_pool = UpstreamPool(UPSTREAM_POOL_SIZE)
+
+
 async def create_proxy(client_websocket: WebSocketCommonProtocol) -> None:
     """
-    Establishes a WebSocket connection to the server and creates two tasks for
+    Takes a connection to the server from the pool and creates two tasks for
     bidirectional message forwarding between the client and the server.
 
     Args:
         client_websocket: The WebSocket connection of the client.
     """
-    
-    token = get_access_token()
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}",
-    }
-
-    async with websockets.connect(
-        SERVICE_URL, additional_headers=headers
-    ) as server_websocket:
+    async with await upstream_pool.acquire() as server_websocket:
         client_to_server_task = asyncio.create_task(
             proxy_task(client_websocket, server_websocket)
         )
@@ -130,6 +258,14 @@ async def main() -> None:
     print(f"SERVICE_ACCOUNT_KEY: {SERVICE_ACCOUNT_KEY}")
     print(f"BEARER_TOKEN exists: {bool(BEARER_TOKEN)}")
     
+    refresh_task = None
+    if SERVICE_ACCOUNT_KEY and os.path.exists(SERVICE_ACCOUNT_KEY):
+        # Fetch the first token before accepting calls, then keep it fresh
+        await get_access_token_async()
+        refresh_task = asyncio.create_task(refresh_token_periodically())
+    
+    upstream_pool.start()
+    
     ssl_context = None
     if SSL_CERT and SSL_KEY:
         ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
@@ -139,7 +275,15 @@ async def main() -> None:
         print(f"Running websocket server (ws) {BIND_HOST}:{PORT}...")
     
     # Start the existing WebSocket server for browser clients
-    websocket_server = websockets.serve(handle_client, BIND_HOST, PORT, ssl=ssl_context)
+    websocket_server = websockets.serve(
+        handle_client,
+        BIND_HOST,
+        PORT,
+        ssl=ssl_context,
+        compression=None,
+        max_size=2**20,
+        write_limit=2**20,
+    )
     
     print("WebSocket server started successfully!")
     print("Note: To enable Twilio integration, also run:")
@@ -147,9 +291,13 @@ async def main() -> None:
     print("  python backend/media_stream_handler.py (for media streams on port 8081)")
     
     # Run the WebSocket server
-    async with websocket_server:
-        await asyncio.Future()  # Run forever
+    try:
+        async with websocket_server:
+            await asyncio.Future()  # Run forever
+    finally:
+        if refresh_task is not None:
+            refresh_task.cancel()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    (uvloop.run if uvloop else asyncio.run)(main())
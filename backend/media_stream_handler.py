@@ -1,105 +1,176 @@
 import asyncio
-import json
 import logging
+import msgspec
 import websockets
+from typing import Optional
 from websockets.legacy.server import WebSocketServerProtocol
-from call_session_manager import session_manager
+from call_session_manager import CallSession, session_manager
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Byte markers for the fast path over Twilio's compact media frames
+_MEDIA_EVENT = b'"event":"media"'
+_PAYLOAD_KEY = b'"payload":"'
+_STREAM_SID_KEY = b'"streamSid":"'
+
+
+def _slice_value(raw: bytes, key: bytes):
+    """Return the string value following key, or None if key is absent.
+
+    Only valid for values that never contain escapes (base64, Twilio SIDs).
+    """
+    start = raw.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    end = raw.find(b'"', start)
+    return raw[start:end] if end >= 0 else None
+
+
+class TwilioMedia(msgspec.Struct):
+    payload: Optional[str] = None
+
+
+class TwilioStart(msgspec.Struct):
+    callSid: Optional[str] = None
+
+
+class TwilioEvent(msgspec.Struct):
+    """Typed view of a Twilio media stream message; other fields are ignored"""
+    event: str = ""
+    streamSid: Optional[str] = None
+    media: Optional[TwilioMedia] = None
+    start: Optional[TwilioStart] = None
+
+
+_decode_event = msgspec.json.Decoder(TwilioEvent).decode
+
+
 class TwilioMediaStreamHandler:
     """Handles Twilio media stream WebSocket connections with Gemini integration"""
     
     def __init__(self):
-        self.active_streams = {}
+        # Handlers for parsed Twilio events, called as handler(data, websocket)
+        self._dispatch = {
+            "connected": self.handle_connected,
+            "start": self.handle_stream_start,
+            "media": self.handle_media_event,
+            "stop": self.handle_stream_stop,
+        }
     
-    async def handle_media_stream(self, websocket: WebSocketServerProtocol, path: str):
+    async def handle_media_stream(self, websocket: WebSocketServerProtocol, path: str = None):
         """Handle incoming Twilio media stream WebSocket connection"""
         
         logger.info(f"New media stream connection from {websocket.remote_address}")
+        dispatch = self._dispatch
+        # Twilio sends one stream per connection; its session is bound here
+        # once the start event has been handled
+        session = None
         
         try:
-            async for message in websocket:
-                data = json.loads(message)
-                event = data.get("event")
+            while True:
+                # Text frames are received as raw bytes, skipping UTF-8
+                # validation; the JSON decoder validates whatever it parses
+                raw = await websocket.recv(decode=False)
                 
-                if event == "connected":
-                    logger.info("Media stream connected")
-                    
-                elif event == "start":
-                    await self.handle_stream_start(data, websocket)
-                    
-                elif event == "media":
-                    await self.handle_media_data(data)
-                    
-                elif event == "stop":
-                    await self.handle_stream_stop(data)
+                # Media frames are nearly all the traffic: slice the two
+                # fields we need instead of parsing the whole frame
+                if _MEDIA_EVENT in raw[:64]:
+                    payload = _slice_value(raw, _PAYLOAD_KEY)
+                    if session is not None and payload is not None:
+                        await self.handle_media_data(session.stream_sid, payload, session)
+                        continue
+                    stream_sid = _slice_value(raw, _STREAM_SID_KEY)
+                    if stream_sid is not None and payload is not None:
+                        await self.handle_media_data(stream_sid.decode(), payload)
+                        continue
+                
+                data = _decode_event(raw)
+                handler = dispatch.get(data.event)
+                if handler is not None:
+                    result = await handler(data, websocket)
+                    if result is not None:
+                        # Only handle_stream_start returns something: the session
+                        session = result
                         
         except websockets.exceptions.ConnectionClosed:
             logger.info("Media stream connection closed")
         except Exception as e:
             logger.error(f"Error in media stream handler: {e}")
+        finally:
+            # Without a stop event the session's sender and writer tasks and
+            # its Gemini connection would outlive the socket
+            if session is not None and session_manager.get_session(session.stream_sid) is session:
+                await session_manager.end_session(session.stream_sid)
+    
+    async def handle_connected(self, data: TwilioEvent, websocket):
+        """Handle stream connected event"""
+        logger.info("Media stream connected")
     
-    async def handle_stream_start(self, data: dict, websocket):
-        """Handle stream start event - create Gemini session"""
+    async def handle_stream_start(self, data: TwilioEvent, websocket) -> Optional[CallSession]:
+        """Handle stream start event - create Gemini session and return it"""
         try:
-            stream_sid = data.get("streamSid")
-            call_sid = data.get("start", {}).get("callSid")
+            stream_sid = data.streamSid
+            call_sid = data.start.callSid if data.start else None
             
             logger.info(f"Media stream started - StreamSid: {stream_sid}, CallSid: {call_sid}")
             
-            # Create call session with Gemini connection
+            # Create call session with Gemini connection; session_manager is
+            # the only registry of active streams
             session = await session_manager.create_session(call_sid, stream_sid, websocket)
             
-            # Store stream info
-            self.active_streams[stream_sid] = {
-                "call_sid": call_sid,
-                "websocket": websocket,
-                "session": session
-            }
-            
             logger.info(f"Created Gemini session for call {call_sid}")
+            return session
             
         except Exception as e:
             logger.error(f"Error handling stream start: {e}")
     
-    async def handle_media_data(self, data: dict):
-        """Handle incoming audio data from Twilio"""
+    async def handle_media_event(self, data: TwilioEvent, websocket):
+        """Handle a media event that missed the fast path"""
+        await self.handle_media_data(
+            data.streamSid, data.media.payload if data.media else None
+        )
+    
+    async def handle_media_data(self, stream_sid: str, payload, session: Optional[CallSession] = None):
+        """
+        Handle incoming audio data from Twilio (payload is base64 str or bytes)
+        
+        The stream's session is looked up unless the caller already has it.
+        """
         try:
-            stream_sid = data.get("streamSid")
-            payload = data.get("media", {}).get("payload")
-            
             if not payload:
                 return
             
             # Get the session for this stream
-            session = session_manager.get_session(stream_sid)
+            if session is None:
+                session = session_manager.get_session(stream_sid)
             
             if session and session.connected:
-                # Send audio to Gemini via virtual client
-                await session.send_audio_to_gemini(payload)
-                logger.debug(f"Processed audio for stream {stream_sid}")
+                # Hand the audio to the session's Gemini sender
+                session.queue_audio_for_gemini(payload)
+                logger.debug("Processed audio for stream %s", stream_sid)
             else:
-                logger.warning(f"No active session for stream {stream_sid}")
+                logger.warning("No active session for stream %s", stream_sid)
                 
         except Exception as e:
             logger.error(f"Error handling media data: {e}")
     
-    async def handle_stream_stop(self, data: dict):
+    async def handle_stream_stop(self, data: TwilioEvent, websocket=None):
         """Handle stream stop event - cleanup session"""
         try:
-            stream_sid = data.get("streamSid")
+            stream_sid = data.streamSid
             logger.info(f"Media stream stopped - StreamSid: {stream_sid}")
             
             # End the session
             await session_manager.end_session(stream_sid)
             
-            # Clean up local storage
-            if stream_sid in self.active_streams:
-                del self.active_streams[stream_sid]
-                
         except Exception as e:
             logger.error(f"Error handling stream stop: {e}")
 
@@ -113,10 +184,13 @@ async def start_media_stream_server():
     async with websockets.serve(
         media_handler.handle_media_stream,
         "0.0.0.0",
-        8083
+        8083,
+        compression=None,
+        max_size=2**16,  # Twilio messages are a few hundred bytes
+        write_limit=2**16,
     ):
         logger.info("Media stream server started successfully!")
         await asyncio.Future()  # Run forever
 
 if __name__ == "__main__":
-    asyncio.run(start_media_stream_server())
+    (uvloop.run if uvloop else asyncio.run)(start_media_stream_server())
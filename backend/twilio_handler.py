@@ -4,6 +4,7 @@ from fastapi.responses import Response
 from twilio.twiml.voice_response import VoiceResponse
 from twilio.request_validator import RequestValidator
 import logging
+from xml.sax.saxutils import escape
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +19,34 @@ app = FastAPI()
 # Twilio request validator for security
 validator = RequestValidator(TWILIO_AUTH_TOKEN) if TWILIO_AUTH_TOKEN else None
 
+
+def _build_twiml_template() -> bytes:
+    """Render the incoming-call TwiML once, with a {hostname} placeholder"""
+    response = VoiceResponse()
+    
+    # Start media stream
+    response.say("Hello! You are now connected to the voice agent. Please speak after the tone.")
+    
+    # Start bidirectional media stream
+    start = response.start()
+    start.stream(
+        url="wss://{hostname}:8083/media-stream",
+        track="both_tracks"
+    )
+    
+    # Keep the call alive
+    response.pause(length=60)
+    
+    return str(response).encode()
+
+
+# The TwiML only differs by hostname between calls
+TWIML_TEMPLATE = _build_twiml_template()
+
+# The hostname lands in the Stream url="..." attribute; escape it the way
+# the SDK (ElementTree) escapes attribute values
+_ATTR_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#09;"}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -34,26 +63,13 @@ async def handle_incoming_call(
     
     logger.info(f"Incoming call - CallSid: {CallSid}, From: {From}, To: {To}")
     
-    # Create TwiML response
-    response = VoiceResponse()
-    
-    # Start media stream
-    response.say("Hello! You are now connected to the voice agent. Please speak after the tone.")
-    
-    # Start bidirectional media stream
-    start = response.start()
-    stream = start.stream(
-        url=f"wss://{request.url.hostname}:8083/media-stream",
-        track="both_tracks"
-    )
-    
-    # Keep the call alive
-    response.pause(length=60)
+    hostname = escape(request.url.hostname or "", _ATTR_ENTITIES).encode()
+    twiml = TWIML_TEMPLATE.replace(b"{hostname}", hostname)
     
     logger.info(f"Generated TwiML for CallSid: {CallSid}")
     
     return Response(
-        content=str(response),
+        content=twiml,
         media_type="application/xml"
     )
 
@@ -71,4 +87,6 @@ async def handle_call_status(
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8082)
+    # uvicorn[standard] provides uvloop and httptools; "auto" falls back to
+    # asyncio and h11 where they are not installed (e.g. Windows)
+    uvicorn.run(app, host="0.0.0.0", port=8082, loop="auto", http="auto")
@@ -1,12 +1,72 @@
 import asyncio
-import json
+import inspect
 import logging
+import msgspec
+import numpy as np
+import orjson
 import websockets
-from typing import Optional, Callable
-from audio_converter import AudioConverter
+from typing import Any, List, Optional, Callable, Union
+from audio_converter import AudioConverter, TWILIO_FRAME_SAMPLES
 
 logger = logging.getLogger(__name__)
 
+# Serialized messages allowed to wait for the socket. Senders block beyond
+# this, so a stalled proxy pushes back on the caller instead of piling up here.
+OUT_QUEUE_SIZE = 4
+
+# Typed view of the Gemini responses we act on; other fields are ignored
+class InlineData(msgspec.Struct):
+    data: Optional[str] = None
+
+
+class Part(msgspec.Struct):
+    text: Optional[str] = None
+    inlineData: Optional[InlineData] = None
+
+
+class ModelTurn(msgspec.Struct):
+    parts: List[Part] = []
+
+
+class Transcription(msgspec.Struct):
+    text: Optional[str] = None
+
+
+class ServerContent(msgspec.Struct):
+    modelTurn: Optional[ModelTurn] = None
+    inputTranscription: Optional[Transcription] = None
+    outputTranscription: Optional[Transcription] = None
+    turnComplete: bool = False
+    interrupted: bool = False
+
+
+class GeminiResponse(msgspec.Struct):
+    setupComplete: Any = None  # {} from Gemini; any value marks completion
+    serverContent: Optional[ServerContent] = None
+
+
+_decode_response = msgspec.json.Decoder(GeminiResponse).decode
+
+# Gemini audio messages only differ by payload: serialize the envelope once
+_AUDIO_MESSAGE_PREFIX, _AUDIO_MESSAGE_SUFFIX = orjson.dumps(
+    AudioConverter.create_gemini_audio_message("@")
+).split(b"@")
+
+# The setup message is the same for every call, so it is serialized once
+_SETUP_MESSAGE = orjson.dumps({
+    "setup": {
+        "model": "projects/gen-lang-client-0427088816/locations/us-central1/publishers/google/models/gemini-2.0-flash-live-preview-04-09",
+        "generation_config": {
+            "response_modalities": ["AUDIO"]
+        },
+        "system_instruction": {
+            "parts": [{"text": "You are a helpful voice assistant answering phone calls. Keep responses concise and natural for voice conversation."}]
+        },
+        "input_audio_transcription": {},
+        "output_audio_transcription": {}
+    }
+})
+
 class VirtualWebSocketClient:
     """
     Virtual WebSocket client that mimics browser behavior for phone calls
@@ -19,9 +79,20 @@ class VirtualWebSocketClient:
         self.websocket: Optional[websockets.WebSocketClientProtocol] = None
         self.connected = False
         
+        # Serialized messages waiting for the writer task; bounded so that
+        # senders wait once the socket falls behind
+        self.out_queue: asyncio.Queue = asyncio.Queue(maxsize=OUT_QUEUE_SIZE)
+        self._writer_task: Optional[asyncio.Task] = None
+        self._listener_task: Optional[asyncio.Task] = None
+        
+        # Scratch for the 16kHz PCM of one Twilio frame, reused every frame
+        self._pcm16_scratch = np.empty(2 * TWILIO_FRAME_SAMPLES, dtype=np.int16)
+        
         # Callbacks for handling responses
+        # Receives Gemini's base64 PCM audio; may be a coroutine function
         self.on_audio_response: Optional[Callable[[str], None]] = None
         self.on_text_response: Optional[Callable[[str], None]] = None
+        self.on_turn_end: Optional[Callable[[bool], None]] = None  # arg: interrupted
         self.on_error: Optional[Callable[[str], None]] = None
         
         logger.info(f"Created virtual client for call {call_sid}")
@@ -30,14 +101,22 @@ class VirtualWebSocketClient:
         """Connect to the existing Gemini WebSocket proxy"""
         try:
             logger.info(f"Connecting to proxy at {self.proxy_url}")
-            self.websocket = await websockets.connect(self.proxy_url)
+            self.websocket = await websockets.connect(
+                self.proxy_url,
+                compression=None,
+                max_size=2**20,
+                max_queue=64,  # bound how many Gemini responses are buffered
+                write_limit=2**14,  # small, so a stalled proxy blocks the writer quickly
+            )
             self.connected = True
+            self._writer_task = asyncio.create_task(self._writer())
             
             # Send initial setup message (same as browser)
             await self.send_setup_message()
             
-            # Start listening for responses
-            asyncio.create_task(self.listen_for_responses())
+            # Start listening for responses; connect() returns to the call
+            # session while the listener runs for the rest of the call
+            self._listener_task = asyncio.create_task(self.listen_for_responses())
             
             logger.info(f"Virtual client connected for call {self.call_sid}")
             
@@ -49,6 +128,9 @@ class VirtualWebSocketClient:
     
     async def disconnect(self):
         """Disconnect from the proxy"""
+        if self._writer_task:
+            self._writer_task.cancel()
+            self._writer_task = None
         if self.websocket and self.connected:
             await self.websocket.close()
             self.connected = False
@@ -56,52 +138,53 @@ class VirtualWebSocketClient:
     
     async def send_setup_message(self):
         """Send initial setup message to Gemini (same format as browser)"""
-        setup_message = {
-            "setup": {
-                "model": "projects/gen-lang-client-0427088816/locations/us-central1/publishers/google/models/gemini-2.0-flash-live-preview-04-09",
-                "generation_config": {
-                    "response_modalities": ["AUDIO"]
-                },
-                "system_instruction": {
-                    "parts": [{"text": "You are a helpful voice assistant answering phone calls. Keep responses concise and natural for voice conversation."}]
-                },
-                "input_audio_transcription": {},
-                "output_audio_transcription": {}
-            }
-        }
-        
-        await self.send_message(setup_message)
+        if self.websocket and self.connected:
+            await self.out_queue.put(_SETUP_MESSAGE)
         logger.info(f"Sent setup message for call {self.call_sid}")
     
     async def send_message(self, message: dict):
-        """Send message to Gemini proxy"""
+        """Queue message for the Gemini proxy (sent by the writer task)"""
         if self.websocket and self.connected:
+            await self.out_queue.put(orjson.dumps(message))
+    
+    async def _writer(self):
+        """
+        Send queued messages in order
+        
+        The writer decouples senders from the socket: they only wait while
+        out_queue is full. Each message is still sent as its own frame.
+        """
+        queue = self.out_queue
+        while self.connected:
+            message = await queue.get()
             try:
-                await self.websocket.send(json.dumps(message))
+                # The proxy and Gemini expect JSON in text frames
+                await self.websocket.send(message, text=True)
             except Exception as e:
                 logger.error(f"Error sending message: {e}")
                 if self.on_error:
                     self.on_error(f"Send error: {e}")
     
-    async def send_audio_from_twilio(self, base64_mulaw: str):
+    async def send_audio_from_twilio(self, base64_mulaw: Union[str, bytes]):
         """
         Convert Twilio audio and send to Gemini
         
         Args:
-            base64_mulaw: Base64 encoded μ-law audio from Twilio
+            base64_mulaw: Base64 encoded μ-law audio from Twilio (str or bytes)
         """
         try:
             # Convert Twilio format to Gemini format
-            base64_pcm = AudioConverter.twilio_to_gemini_format(base64_mulaw)
+            base64_pcm = AudioConverter.twilio_to_gemini_payload(
+                base64_mulaw, self._pcm16_scratch
+            )
             
-            if base64_pcm:
-                # Create Gemini audio message
-                audio_message = AudioConverter.create_gemini_audio_message(base64_pcm)
-                
-                # Send to Gemini
-                await self.send_message(audio_message)
+            if base64_pcm and self.websocket and self.connected:
+                # Wrap the payload in the pre-serialized Gemini audio envelope
+                await self.out_queue.put(
+                    b"".join((_AUDIO_MESSAGE_PREFIX, base64_pcm, _AUDIO_MESSAGE_SUFFIX))
+                )
                 
-                logger.debug(f"Sent audio to Gemini for call {self.call_sid}")
+                logger.debug("Sent audio to Gemini for call %s", self.call_sid)
             
         except Exception as e:
             logger.error(f"Error processing Twilio audio: {e}")
@@ -110,10 +193,68 @@ class VirtualWebSocketClient:
     
     async def listen_for_responses(self):
         """Listen for responses from Gemini and handle them"""
+        # Callbacks are set before connect(); bind everything the loop uses
+        recv = self.websocket.recv
+        on_audio_response = self.on_audio_response
+        on_text_response = self.on_text_response
+        on_turn_end = self.on_turn_end
+        call_sid = self.call_sid
+        
         try:
-            async for message in self.websocket:
-                data = json.loads(message)
-                await self.handle_gemini_response(data)
+            while True:
+                # Raw bytes: skip UTF-8 validation, the decoder validates anyway
+                message = await recv(decode=False)
+                try:
+                    data = _decode_response(message)
+                except (msgspec.DecodeError, msgspec.ValidationError) as e:
+                    # One malformed frame must not end the listener
+                    logger.warning("Skipping undecodable response for call %s: %s", call_sid, e)
+                    continue
+                
+                # Check for setup completion
+                if data.setupComplete is not None:
+                    logger.info("Setup complete for call %s", call_sid)
+                    continue
+                
+                server_content = data.serverContent
+                if server_content is None:
+                    continue
+                
+                # Handle transcriptions
+                transcription = server_content.inputTranscription
+                if transcription and transcription.text:
+                    logger.info("Input transcription: %s", transcription.text)
+                
+                transcription = server_content.outputTranscription
+                if transcription and transcription.text:
+                    logger.info("Output transcription: %s", transcription.text)
+                    if on_text_response:
+                        on_text_response(transcription.text)
+                
+                # Handle audio responses
+                if server_content.modelTurn is not None:
+                    for part in server_content.modelTurn.parts:
+                        if part.inlineData is not None:
+                            # This is audio data from Gemini; the call session buffers
+                            # and converts it to Twilio format frame by frame
+                            base64_pcm = part.inlineData.data
+                        
+                            if base64_pcm and on_audio_response:
+                                result = on_audio_response(base64_pcm)
+                                if inspect.isawaitable(result):
+                                    await result
+                                logger.debug("Sent audio response to Twilio for call %s", call_sid)
+                    
+                        elif part.text is not None:
+                            # Text response
+                            if on_text_response:
+                                on_text_response(part.text)
+                
+                # Let the session flush or drop audio held for the turn
+                if (server_content.turnComplete or server_content.interrupted) and on_turn_end:
+                    result = on_turn_end(server_content.interrupted)
+                    if inspect.isawaitable(result):
+                        await result
                 
         except websockets.exceptions.ConnectionClosed:
             logger.info(f"Gemini connection closed for call {self.call_sid}")
@@ -122,52 +263,3 @@ class VirtualWebSocketClient:
             logger.error(f"Error listening for responses: {e}")
             if self.on_error:
                 self.on_error(f"Listen error: {e}")
-    
-    async def handle_gemini_response(self, data: dict):
-        """Handle different types of responses from Gemini"""
-        try:
-            # Check for setup completion
-            if data.get("setupComplete"):
-                logger.info(f"Setup complete for call {self.call_sid}")
-                return
-            
-            server_content = data.get("serverContent", {})
-            
-            # Handle transcriptions
-            if "inputTranscription" in server_content:
-                transcription = server_content["inputTranscription"]
-                if transcription.get("text"):
-                    logger.info(f"Input transcription: {transcription['text']}")
-            
-            if "outputTranscription" in server_content:
-                transcription = server_content["outputTranscription"]
-                if transcription.get("text"):
-                    logger.info(f"Output transcription: {transcription['text']}")
-                    if self.on_text_response:
-                        self.on_text_response(transcription["text"])
-            
-            # Handle audio responses
-            model_turn = server_content.get("modelTurn", {})
-            parts = model_turn.get("parts", [])
-            
-            for part in parts:
-                if "inlineData" in part:
-                    # This is audio data from Gemini
-                    base64_pcm = part["inlineData"]["data"]
-                    
-                    # Convert to Twilio format
-                    base64_mulaw = AudioConverter.gemini_to_twilio_format(base64_pcm)
-                    
-                    if base64_mulaw and self.on_audio_response:
-                        self.on_audio_response(base64_mulaw)
-                        logger.debug(f"Sent audio response to Twilio for call {self.call_sid}")
-                
-                elif "text" in part:
-                    # Text response
-                    if self.on_text_response:
-                        self.on_text_response(part["text"])
-        
-        except Exception as e:
-            logger.error(f"Error handling Gemini response: {e}")
-            if self.on_error:
-                self.on_error(f"Response handling error: {e}")
@@ -3,28 +3,45 @@
 import asyncio
 import aiohttp
 import websockets
-import json
+from websockets.protocol import State
 import time
 from datetime import datetime
 import sys
 
+try:
+    import orjson as jsonlib
+except ImportError:
+    import json as jsonlib
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Shared by every HTTP check instead of one timeout object per request
+_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
 class HealthMonitor:
     """Monitors health of all Voice Query Agent services"""
     
     def __init__(self):
         self.services = {
-            "gemini_proxy": {"type": "websocket", "url": "ws://localhost:8080", "status": "unknown"},
+            # Each proxy connection opens a Gemini session upstream, so the
+            # proxy is probed with a fresh connection that is closed again
+            "gemini_proxy": {"type": "websocket", "url": "ws://localhost:8080", "status": "unknown", "persistent": False},
             "twilio_webhooks": {"type": "http", "url": "http://localhost:8082/health", "status": "unknown"},
-            "media_streams": {"type": "websocket", "url": "ws://localhost:8083", "status": "unknown"}
+            "media_streams": {"type": "websocket", "url": "ws://localhost:8083", "status": "unknown", "persistent": True}
         }
         self.session = None
+        # Probe connections kept open between checks, keyed by service name
+        self._ws_conns = {}
     
     async def check_http_service(self, name, url):
         """Check HTTP service health"""
         try:
-            async with self.session.get(url, timeout=5) as response:
+            async with self.session.get(url, timeout=_TIMEOUT) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = await response.json(loads=jsonlib.loads)
                     self.services[name]["status"] = "healthy"
                     self.services[name]["response"] = data
                     return True
@@ -36,35 +53,62 @@ class HealthMonitor:
             return False
     
     async def check_websocket_service(self, name, url):
-        """Check WebSocket service health"""
+        """Check WebSocket service health, over a persistent connection where configured"""
         try:
-            async with websockets.connect(url, timeout=5) as websocket:
-                # For Gemini proxy, send a test message
-                if name == "gemini_proxy":
-                    test_message = {"test": "health_check"}
-                    await websocket.send(json.dumps(test_message))
-                
-                self.services[name]["status"] = "healthy"
-                return True
+            websocket = self._ws_conns.get(name)
+            if not self.services[name]["persistent"]:
+                async with websockets.connect(url, open_timeout=5) as websocket:
+                    # For Gemini proxy, send a test message
+                    if name == "gemini_proxy":
+                        test_message = {"test": "health_check"}
+                        await websocket.send(jsonlib.dumps(test_message))
+            
+            elif websocket is None or websocket.state is not State.OPEN:
+                self._ws_conns[name] = await websockets.connect(url, open_timeout=5)
+            else:
+                # Already connected: a ping/pong round trip is enough
+                pong_waiter = await websocket.ping()
+                await asyncio.wait_for(pong_waiter, 2.0)
+            
+            self.services[name]["status"] = "healthy"
+            return True
         except Exception as e:
+            websocket = self._ws_conns.pop(name, None)
+            if websocket is not None:
+                # The server may be hung, so drop the socket without a close handshake
+                websocket.transport.abort()
             self.services[name]["status"] = f"error: {str(e)[:50]}"
             return False
     
+    async def close(self):
+        """Close the probe connections and the HTTP session"""
+        for websocket in self._ws_conns.values():
+            await websocket.close()
+        self._ws_conns.clear()
+        
+        if self.session:
+            await self.session.close()
+            self.session = None
+    
     async def check_all_services(self):
         """Check health of all services"""
         if not self.session:
-            self.session = aiohttp.ClientSession()
+            # Keep-alive connections are reused across monitoring intervals
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=8, keepalive_timeout=60)
+            )
         
-        tasks = []
-        for name, config in self.services.items():
-            if config["type"] == "http":
-                task = self.check_http_service(name, config["url"])
-            else:
-                task = self.check_websocket_service(name, config["url"])
-            tasks.append(task)
+        # The checks catch their own errors, so none of them aborts the group
+        async with asyncio.TaskGroup() as tg:
+            tasks = []
+            for name, config in self.services.items():
+                if config["type"] == "http":
+                    task = tg.create_task(self.check_http_service(name, config["url"]))
+                else:
+                    task = tg.create_task(self.check_websocket_service(name, config["url"]))
+                tasks.append(task)
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        return results
+        return [task.result() for task in tasks]
     
     def print_status(self):
         """Print current status of all services"""
@@ -107,8 +151,7 @@ class HealthMonitor:
         except KeyboardInterrupt:
             print("\n🛑 Monitoring stopped")
         finally:
-            if self.session:
-                await self.session.close()
+            await self.close()
 
 async def run_health_check():
     """Run a single health check"""
@@ -116,8 +159,7 @@ async def run_health_check():
     await monitor.check_all_services()
     healthy = monitor.print_status()
     
-    if monitor.session:
-        await monitor.session.close()
+    await monitor.close()
     
     return healthy
 
@@ -171,7 +213,7 @@ async def test_call_flow():
         
         async with websockets.connect("ws://localhost:8083/media-stream") as websocket:
             # Send connected event
-            await websocket.send(json.dumps({"event": "connected"}))
+            await websocket.send(jsonlib.dumps({"event": "connected"}))
             
             # Send start event
             start_msg = {
@@ -179,7 +221,7 @@ async def test_call_flow():
                 "streamSid": "test_flow_stream",
                 "start": {"callSid": "test_flow_call_123"}
             }
-            await websocket.send(json.dumps(start_msg))
+            await websocket.send(jsonlib.dumps(start_msg))
             
             # Send sample audio
             import base64
@@ -189,11 +231,11 @@ async def test_call_flow():
                 "streamSid": "test_flow_stream",
                 "media": {"payload": sample_audio}
             }
-            await websocket.send(json.dumps(media_msg))
+            await websocket.send(jsonlib.dumps(media_msg))
             
             # Send stop event
             stop_msg = {"event": "stop", "streamSid": "test_flow_stream"}
-            await websocket.send(json.dumps(stop_msg))
+            await websocket.send(jsonlib.dumps(stop_msg))
             
             print("✅ Media stream flow completed successfully")
         
@@ -207,11 +249,11 @@ async def test_call_flow():
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         if sys.argv[1] == "monitor":
-            asyncio.run(run_continuous_monitoring())
+            (uvloop.run if uvloop else asyncio.run)(run_continuous_monitoring())
         elif sys.argv[1] == "test":
-            asyncio.run(test_call_flow())
+            (uvloop.run if uvloop else asyncio.run)(test_call_flow())
         else:
             print("Usage: python health_monitor.py [monitor|test]")
     else:
         # Single health check
-        asyncio.run(run_health_check())
+        (uvloop.run if uvloop else asyncio.run)(run_health_check())
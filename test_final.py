@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import asyncio
+import base64
 import json
 import sys
 import os
@@ -8,22 +9,23 @@ import os
 # Add backend directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
 
+from audio_converter import AudioConverter
+from virtual_client import VirtualWebSocketClient
+from call_session_manager import CallSessionManager
+
+# 20 ms of μ-law silence, as Twilio sends it
+SILENCE_ULAW_B64 = base64.b64encode(b"\x55" * 160).decode("ascii")
+
 async def test_complete_flow():
     """Test the complete audio flow with all components"""
     
     print("🎯 Complete Flow Test - Phase 2")
     print("=" * 60)
     
-    # Import all components
-    from audio_converter import AudioConverter
-    from virtual_client import VirtualWebSocketClient
-    from call_session_manager import CallSessionManager
-    
     print("1️⃣ Testing Audio Processing Pipeline...")
     
     # Simulate Twilio audio data (μ-law silence)
-    import base64
-    twilio_audio = base64.b64encode(b'\x55' * 160).decode('utf-8')
+    twilio_audio = SILENCE_ULAW_B64
     print(f"   📥 Twilio audio input: {len(twilio_audio)} chars")
     
     # Convert to Gemini format
@@ -1,21 +1,66 @@
 #!/usr/bin/env python3
 
 import asyncio
-import json
+import aiohttp
+import orjson
+import base64
 import websockets
 import sys
 import os
 import time
+from functools import lru_cache
 
 # Add backend directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
 
+from audio_converter import AudioConverter
+from virtual_client import VirtualWebSocketClient
+from call_session_manager import CallSessionManager
+from media_stream_handler import TwilioMediaStreamHandler
+
+# Base64 μ-law audio patterns for the conversion tests, encoded once
+_FIXTURES = tuple(
+    (name, base64.b64encode(data).decode('ascii'))
+    for name, data in [
+        ("Silence", b'\x55' * 160),
+        ("Pattern 1", b'\x50\x60\x55\x65' * 40),
+        ("Pattern 2", bytes(range(160))),
+    ]
+)
+
+# Mock Gemini replies, serialized once. An audio reply is the prefix, one
+# _AUDIO_PART per answered message joined by commas, then the suffix.
+_SETUP_COMPLETE_BYTES = orjson.dumps({"setupComplete": True}, option=orjson.OPT_APPEND_NEWLINE)
+_AUDIO_PART = orjson.dumps({
+    "inlineData": {
+        "mimeType": "audio/pcm",
+        "data": "dGVzdCBhdWRpbyByZXNwb25zZQ=="  # "test audio response" in base64
+    }
+})
+_AUDIO_RESPONSE_PREFIX = b'{"serverContent":{"modelTurn":{"parts":['
+_AUDIO_RESPONSE_SUFFIX = b']}}}\n'
+
+@lru_cache(maxsize=8)
+def _conversion_chain(base64_mulaw):
+    """Twilio -> Gemini -> Twilio conversion of a fixture, memoized
+
+    The conversions are pure functions of their input, so repeated runs in
+    one process reuse the first result.
+    """
+    base64_pcm = AudioConverter.twilio_to_gemini_format(base64_mulaw)
+    return base64_pcm, AudioConverter.gemini_to_twilio_format(base64_pcm)
+
 async def test_services_individually():
     """Test each service individually without dependencies"""
     
     print("🧪 Individual Service Testing")
     print("=" * 60)
     
+    # The webhook handler takes the longest to come up, so it boots in its
+    # own process while the in-process checks run. The checks themselves
+    # still run in order to keep the report readable.
+    webhook_process = await start_webhook_handler()
+    
     # Test 1: Audio Conversion
     print("1️⃣ Testing Audio Conversion...")
     await test_audio_conversion()
@@ -30,7 +75,7 @@ async def test_services_individually():
     
     # Test 4: Webhook Handler
     print("\n4️⃣ Testing Webhook Handler...")
-    await test_webhook_handler()
+    await test_webhook_handler(webhook_process)
     
     # Test 5: Media Stream Handler (basic)
     print("\n5️⃣ Testing Media Stream Handler...")
@@ -38,24 +83,12 @@ async def test_services_individually():
 
 async def test_audio_conversion():
     """Test audio conversion thoroughly"""
-    from audio_converter import AudioConverter
-    import base64
-    
-    # Test different audio patterns
-    test_patterns = [
-        ("Silence", b'\x55' * 160),
-        ("Pattern 1", b'\x50\x60\x55\x65' * 40),
-        ("Pattern 2", bytes(range(160))),
-    ]
-    
     all_passed = True
     
-    for name, mulaw_data in test_patterns:
-        base64_mulaw = base64.b64encode(mulaw_data).decode('utf-8')
-        
+    # Test different audio patterns
+    for name, base64_mulaw in _FIXTURES:
         # Test conversion chain
-        base64_pcm = AudioConverter.twilio_to_gemini_format(base64_mulaw)
-        base64_mulaw_back = AudioConverter.gemini_to_twilio_format(base64_pcm)
+        base64_pcm, base64_mulaw_back = _conversion_chain(base64_mulaw)
         message = AudioConverter.create_gemini_audio_message(base64_pcm)
         
         if base64_pcm and base64_mulaw_back and message.get("realtime_input"):
@@ -72,8 +105,6 @@ async def test_audio_conversion():
 def test_virtual_client_creation():
     """Test virtual client creation without connection"""
     try:
-        from virtual_client import VirtualWebSocketClient
-        
         client = VirtualWebSocketClient("test_call_123")
         
         # Test callback setup
@@ -91,8 +122,6 @@ def test_virtual_client_creation():
 def test_session_manager_creation():
     """Test session manager creation"""
     try:
-        from call_session_manager import CallSessionManager
-        
         manager = CallSessionManager()
         count = manager.get_active_session_count()
         
@@ -101,45 +130,47 @@ def test_session_manager_creation():
     except Exception as e:
         print(f"   ❌ Session manager creation failed: {e}")
 
-async def test_webhook_handler():
-    """Test webhook handler by starting it briefly"""
+async def start_webhook_handler():
+    """Start the webhook handler in a subprocess"""
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "backend/twilio_handler.py",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+
+async def test_webhook_handler(process):
+    """Test the webhook handler started by start_webhook_handler, then stop it"""
     try:
-        # Start webhook handler
-        process = await asyncio.create_subprocess_exec(
-            sys.executable, "backend/twilio_handler.py",
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Wait for startup
-        await asyncio.sleep(2)
+        # Poll the health check with backoff until the handler answers
+        # (about 3 s in total) instead of sleeping a fixed startup time
+        status = None
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=0.5)) as session:
+            for delay in (0.05, 0.1, 0.2, 0.4, 0.8, 1.6):
+                await asyncio.sleep(delay)
+                try:
+                    async with session.get("http://localhost:8082/health") as response:
+                        status = response.status
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    continue
         
         # Test endpoints
-        import requests
-        
-        try:
-            # Health check
-            response = requests.get("http://localhost:8082/health", timeout=3)
-            if response.status_code == 200:
-                print("   ✅ Webhook handler responding")
-            else:
-                print("   ❌ Webhook handler not responding properly")
-                
-        except requests.exceptions.RequestException:
+        if status is None:
             print("   ❌ Could not connect to webhook handler")
-        
-        # Cleanup
-        process.terminate()
-        await process.wait()
+        elif status == 200:
+            print("   ✅ Webhook handler responding")
+        else:
+            print("   ❌ Webhook handler not responding properly")
         
     except Exception as e:
         print(f"   ❌ Webhook handler test failed: {e}")
+    finally:
+        process.terminate()
+        await process.wait()
 
 def test_media_handler_creation():
     """Test media handler creation without starting server"""
     try:
-        from media_stream_handler import TwilioMediaStreamHandler
-        
         handler = TwilioMediaStreamHandler()
         print("   ✅ Media stream handler created successfully")
         
@@ -153,47 +184,66 @@ async def test_mock_integration():
     print("=" * 50)
     
     # Create a simple mock Gemini server
-    async def mock_gemini_server(websocket, path):
-        """Mock Gemini server that responds to setup and audio"""
+    async def mock_gemini_server(websocket, path=None):
+        """Mock Gemini server that responds to setup and audio
+        
+        Messages that are already buffered when one arrives are handled as a
+        batch, and all their audio replies go out as one multi-part frame.
+        """
+        next_message = asyncio.ensure_future(websocket.recv())
         try:
-            async for message in websocket:
-                data = json.loads(message)
+            while True:
+                batch = [await next_message]
                 
-                if "setup" in data:
-                    # Respond with setup complete
-                    setup_response = {"setupComplete": True}
-                    await websocket.send(json.dumps(setup_response))
-                    print("   📡 Mock Gemini: Setup complete sent")
+                # Collect further messages without waiting for the network
+                while True:
+                    next_message = asyncio.ensure_future(websocket.recv())
+                    await asyncio.sleep(0)
+                    if not next_message.done() or next_message.exception():
+                        break
+                    batch.append(next_message.result())
                 
-                elif "realtime_input" in data:
-                    # Respond with mock audio
-                    audio_response = {
-                        "serverContent": {
-                            "modelTurn": {
-                                "parts": [{
-                                    "inlineData": {
-                                        "mimeType": "audio/pcm",
-                                        "data": "dGVzdCBhdWRpbyByZXNwb25zZQ=="  # "test audio response" in base64
-                                    }
-                                }]
-                            }
-                        }
-                    }
-                    await websocket.send(json.dumps(audio_response))
-                    print("   📡 Mock Gemini: Audio response sent")
+                audio_parts = 0
+                for message in batch:
+                    data = orjson.loads(message)
+                    
+                    if "setup" in data:
+                        # Respond with setup complete
+                        await websocket.send(_SETUP_COMPLETE_BYTES)
+                        print("   📡 Mock Gemini: Setup complete sent")
+                    
+                    elif "realtime_input" in data:
+                        # Respond with mock audio
+                        audio_parts += 1
+                
+                if audio_parts:
+                    await websocket.send(b"".join((
+                        _AUDIO_RESPONSE_PREFIX,
+                        b",".join([_AUDIO_PART] * audio_parts),
+                        _AUDIO_RESPONSE_SUFFIX,
+                    )))
+                    print(f"   📡 Mock Gemini: Audio response sent ({audio_parts} parts)")
                     
         except websockets.exceptions.ConnectionClosed:
             print("   📡 Mock Gemini: Connection closed")
+        finally:
+            next_message.cancel()
     
     # Start mock server
-    mock_server = await websockets.serve(mock_gemini_server, "localhost", 8084)
+    mock_server = await websockets.serve(
+        mock_gemini_server,
+        "127.0.0.1",
+        8084,
+        compression=None,  # control and audio frames are tiny; skip deflate
+        max_queue=None,
+        max_size=2**20,
+        write_limit=2**20,  # let bursts of replies buffer without pausing the handler
+    )
     print("   🎭 Mock Gemini server started on port 8084")
     
     try:
         # Test virtual client with mock server
-        from virtual_client import VirtualWebSocketClient
-        
-        client = VirtualWebSocketClient("test_call", "ws://localhost:8084")
+        client = VirtualWebSocketClient("test_call", "ws://127.0.0.1:8084")
         
         responses = []
         client.on_audio_response = lambda x: responses.append(("audio", len(x)))
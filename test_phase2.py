@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import asyncio
-import base64
 import json
 import websockets
 import sys
@@ -11,15 +10,19 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
 
 from audio_converter import AudioConverter
+from virtual_client import VirtualWebSocketClient
+from call_session_manager import CallSessionManager
+from media_stream_handler import TwilioMediaStreamHandler
+from test_final import SILENCE_ULAW_B64
+
 
 def test_audio_conversion():
     """Test audio format conversion functions"""
     print("🎵 Testing Audio Conversion...")
     print("=" * 50)
     
-    # Create sample μ-law data (silence)
-    sample_mulaw = b'\xff' * 160  # 160 bytes = 20ms at 8kHz
-    base64_mulaw = base64.b64encode(sample_mulaw).decode('utf-8')
+    # Sample μ-law data (silence)
+    base64_mulaw = SILENCE_ULAW_B64
     
     try:
         # Test Twilio to Gemini conversion
@@ -39,6 +42,16 @@ def test_audio_conversion():
         else:
             print("❌ Gemini → Twilio conversion: Failed")
         
+        # Test G.711 lookup tables: every μ-law code must survive a round trip
+        # (0x7F is the duplicate "negative zero" code and encodes back as 0xFF)
+        all_codes = bytes(range(256))
+        round_trip = AudioConverter.pcm16_to_mulaw(AudioConverter.mulaw_to_pcm16(all_codes))
+        expected = all_codes.replace(b'\x7f', b'\xff')
+        if round_trip == expected:
+            print("✅ μ-law ↔ PCM round trip: Success")
+        else:
+            print("❌ μ-law ↔ PCM round trip: Failed")
+        
         # Test message creation
         message = AudioConverter.create_gemini_audio_message(base64_pcm)
         if message.get("realtime_input", {}).get("media_chunks"):
@@ -56,8 +69,6 @@ async def test_virtual_client():
     print("=" * 50)
     
     try:
-        from virtual_client import VirtualWebSocketClient
-        
         # Create virtual client
         client = VirtualWebSocketClient("test_call_123")
         
@@ -95,8 +106,6 @@ async def test_session_manager():
     print("=" * 50)
     
     try:
-        from call_session_manager import CallSessionManager
-        
         # Create session manager
         manager = CallSessionManager()
         
@@ -118,9 +127,6 @@ async def test_websocket_server():
     print("=" * 50)
     
     try:
-        # Import the updated handler
-        from media_stream_handler import TwilioMediaStreamHandler
-        
         handler = TwilioMediaStreamHandler()
         print("✅ Enhanced media stream handler created")
         print("   Ready to handle Twilio streams with Gemini integration")